@@ -0,0 +1,224 @@
+import argparse
+import csv
+import json
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import IO, Callable, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from data_manager import DEFAULT_CUSTOM_RULES
+from query_system import QueryAgent, ResponseSchemaSQL, question_key
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket that refills continuously at `rate_per_minute`.
+
+    `clock` and `sleep` default to `time.monotonic` and `time.sleep` and can
+    be replaced, e.g. with a fake clock in tests.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = self.capacity
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def acquire(self, amount: float = 1):
+        """Blocks until `amount` tokens are available, then takes them."""
+        # A single request larger than the bucket could never be served otherwise.
+        amount = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                now = self.clock()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            self.sleep(wait)
+
+
+class LLMRateLimiter:
+    """Limits LLM traffic to a number of requests and tokens per minute."""
+
+    def __init__(self, requests_per_minute: float = 500, tokens_per_minute: float = 30000,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        self.requests = TokenBucket(requests_per_minute, clock=clock, sleep=sleep)
+        self.tokens = TokenBucket(tokens_per_minute, clock=clock, sleep=sleep)
+
+    def acquire(self, estimated_tokens: int):
+        self.requests.acquire(1)
+        self.tokens.acquire(estimated_tokens)
+
+
+class StubRateLimitError(Exception):
+    """Mimics the provider's 429 error so retries can be exercised offline."""
+    status_code = 429
+
+
+class StubLLM:
+    """
+    A deterministic, offline stand-in for ChatOpenAI. SQL generation returns
+    the admin's students; answers just report how many rows came back.
+
+    Args:
+        latency (float): Seconds to sleep per call, to simulate network time.
+        rate_limit_every (int): If > 0, every Nth call raises a 429 error.
+    """
+
+    def __init__(self, latency: float = 0.0, rate_limit_every: int = 0):
+        self.latency = latency
+        self.rate_limit_every = rate_limit_every
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def _call(self):
+        with self.lock:
+            self.calls += 1
+            calls = self.calls
+        time.sleep(self.latency)
+        if self.rate_limit_every and calls % self.rate_limit_every == 0:
+            raise StubRateLimitError("Rate limit reached (stub)")
+
+    def with_structured_output(self, schema):
+        def generate_sql(prompt_value):
+            self._call()
+            match = re.search(r"admins\.id = '([^']*)'", prompt_value.to_string())
+            admin_id = match.group(1) if match else ""
+            return ResponseSchemaSQL(sql_query=(
+                "SELECT s.* FROM students s JOIN admins a ON s.grade = a.grade "
+                f"AND s.class = a.class AND s.region = a.region WHERE a.id = '{admin_id}'"
+            ))
+        return generate_sql
+
+    def __call__(self, prompt_value):
+        from langchain_core.messages import AIMessage
+
+        self._call()
+        match = re.search(r"Data \(from SQL\):\s*(.*?)\n\s*Respond", prompt_value.to_string(), re.S)
+        rows = match.group(1).strip() if match else "[]"
+        return AIMessage(content=f"Stub answer based on {rows.count('{')} row(s).")
+
+
+def load_questions(path: str) -> List[Tuple[str, str]]:
+    """
+    Reads (admin_id, question) pairs from a .jsonl file (one object with
+    `admin_id` and `question` per line) or a .csv file with those headers.
+    """
+    with open(path, 'r', newline='') as f:
+        if path.endswith(".csv"):
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+    return [(str(row["admin_id"]).strip(), row["question"]) for row in rows]
+
+
+def _answer_one(agent: QueryAgent, admin_id: str, question: str) -> Dict:
+    started = time.perf_counter()
+    try:
+        response = agent.answer_question(question, admin_id)
+    except Exception as e:
+        response = {"answer": f"Sorry, something went wrong: {e}", "error": str(e)}
+    response["elapsed_s"] = round(time.perf_counter() - started, 3)
+    return response
+
+
+def run_batch(agent: QueryAgent, questions: List[Tuple[str, str]], output: IO[str], max_workers: int = 4) -> Dict:
+    """
+    Answers every (admin_id, question) pair concurrently and writes one JSON
+    line per input pair to `output` as soon as its answer is ready.
+
+    Identical questions from the same admin (see `query_system.question_key`;
+    only whitespace is normalized)
+    are only sent to the agent once; the copies are written with
+    `"deduplicated": true`.
+
+    Returns:
+        dict: A summary with counts and the total elapsed time.
+    """
+    started = time.perf_counter()
+    saved_before = agent.get_coalescing_metrics()["saved"]
+    groups: Dict[Tuple[str, str], List[int]] = {}
+    for index, (admin_id, question) in enumerate(questions):
+        groups.setdefault(question_key(admin_id, question), []).append(index)
+
+    errors = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(_answer_one, agent, *questions[indices[0]]): indices
+            for indices in groups.values()
+        }
+        for future in as_completed(futures):
+            response = future.result()
+            indices = futures[future]
+            if response.get("error"):
+                errors += len(indices)
+            for n, index in enumerate(indices):
+                admin_id, question = questions[index]
+                record = {
+                    "index": index,
+                    "admin_id": admin_id,
+                    "question": question,
+                    "answer": response.get("answer"),
+                    "sql": response.get("sql"),
+                    "data": response.get("data"),
+                    "error": response.get("error"),
+                    "elapsed_s": response["elapsed_s"],
+                    "deduplicated": n > 0,
+                }
+                output.write(json.dumps(record, default=str) + "\n")
+            output.flush()
+
+    saved = agent.get_coalescing_metrics()["saved"]
+    return {
+        "questions": len(questions),
+        "unique_questions": len(groups),
+        "errors": errors,
+        "llm_calls_saved": saved["llm_calls"] - saved_before["llm_calls"],
+        "sql_executions_saved": saved["sql_executions"] - saved_before["sql_executions"],
+        "elapsed_s": round(time.perf_counter() - started, 3),
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Answer a file of (admin_id, question) pairs in batch.")
+    parser.add_argument("input", help="A .jsonl or .csv file with admin_id and question fields.")
+    parser.add_argument("output", help="Where to write the NDJSON results.")
+    parser.add_argument("--db", default="school_management.db", help="Path to the populated SQLite database.")
+    parser.add_argument("--workers", type=int, default=4, help="Number of questions answered concurrently.")
+    parser.add_argument("--rpm", type=float, default=500, help="Max LLM requests per minute.")
+    parser.add_argument("--tpm", type=float, default=30000, help="Max LLM tokens per minute.")
+    parser.add_argument("--stub-llm", action="store_true", help="Use a local stub LLM instead of OpenAI (offline).")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+
+    agent = QueryAgent.restore(
+        args.db,
+        custom_rules=DEFAULT_CUSTOM_RULES,
+        llm=StubLLM() if args.stub_llm else None,
+        rate_limiter=LLMRateLimiter(requests_per_minute=args.rpm, tokens_per_minute=args.tpm),
+    )
+    if agent is None:
+        print(f"Error: '{args.db}' is missing or not a valid database. Populate it first.", file=sys.stderr)
+        return 1
+    questions = load_questions(args.input)
+
+    with open(args.output, 'w') as f:
+        summary = run_batch(agent, questions, f, max_workers=args.workers)
+
+    print(f"Batch complete: {json.dumps(summary)}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -198,17 +198,40 @@
 import sqlite3
 import json
 import os
+import pathlib
+from contextlib import closing
 from typing import List, Optional
 
+# Rules appended to the schema representation given to the LLM.
+DEFAULT_CUSTOM_RULES = [
+    "Filter by admin access using the admins table on grade, class, and region."
+]
+
 class DatabaseManager:
     """
     Manages the creation, setup, and description of the school's SQLite database
     based on a direct mapping from a JSON file.
     """
 
+    # Tables that must exist for a database file to be reused without re-ingesting.
+    REQUIRED_TABLES = ("students", "admins", "classes", "exams", "assignments", "quizzes", "submissions")
+
+    # Pre-aggregated tables maintained at ingest time, with the description given to the LLM.
+    SUMMARY_TABLES = {
+        "assignment_class_stats": (
+            "one row per assignment and student region within the assignment's grade/class: "
+            "student_count, submitted_count, submission_rate (0-1), avg_score, min_score, max_score"
+        ),
+        "student_completion_stats": (
+            "one row per student: assigned_count (assignments for their grade/class), "
+            "submitted_count, completion_rate (0-1), avg_score"
+        ),
+    }
+
     def __init__(self, db_path: str = "school_management_v2.db"):
         """Initializes the DatabaseManager."""
         self.db_path = db_path
+        self.schema_cache_path = f"{db_path}.schema.json"
 
     def setup_database_from_json(self, json_path: str, overwrite: bool = True):
         """
@@ -221,6 +244,8 @@ class DatabaseManager:
         if overwrite and os.path.exists(self.db_path):
             os.remove(self.db_path)
             print(f"Removed existing database at '{self.db_path}'.")
+        if os.path.exists(self.schema_cache_path):
+            os.remove(self.schema_cache_path)
 
         if not os.path.exists(json_path):
             print(f"Error: JSON file not found at '{json_path}'. Aborting.")
@@ -232,14 +257,24 @@ class DatabaseManager:
         cursor = conn.cursor()
 
         try:
+            # Loading into a database whose summary tables are already filled is a
+            # delta load: only the summary rows touched by the new records are
+            # recomputed. New databases, and ones ingested before the summary
+            # tables existed, get a full rebuild.
+            is_delta_load = self._has_summary_tables(cursor)
+
             print("\nSTEP 1: Creating database tables based on JSON structure...")
             self._create_tables(cursor)
             print("Tables created successfully.")
 
             print(f"\nSTEP 2: Populating database from '{json_path}'...")
-            self._populate_tables_from_json(cursor, json_path)
+            affected_classes = self._populate_tables_from_json(cursor, json_path, collect_affected=is_delta_load)
             print("Data population complete.")
 
+            print("\nSTEP 3: Updating summary tables...")
+            self._refresh_summary_tables(cursor, affected_classes)
+            print("Summary tables updated.")
+
             conn.commit()
             print("\nDatabase setup successful. All changes have been committed.")
 
@@ -326,11 +361,57 @@ class DatabaseManager:
             )
         ''')
 
-    def _populate_tables_from_json(self, cursor: sqlite3.Cursor, json_path: str):
-        """Reads the JSON file and inserts data using a unified mapping."""
+        # Summary tables, see SUMMARY_TABLES and _refresh_summary_tables.
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS assignment_class_stats (
+                assignment_id TEXT,
+                title TEXT,
+                grade INTEGER,
+                class TEXT,
+                region TEXT,
+                student_count INTEGER,
+                submitted_count INTEGER,
+                submission_rate REAL,
+                avg_score REAL,
+                min_score INTEGER,
+                max_score INTEGER,
+                PRIMARY KEY (assignment_id, region)
+            )
+        ''')
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS student_completion_stats (
+                student_id TEXT PRIMARY KEY,
+                name TEXT,
+                grade INTEGER,
+                class TEXT,
+                region TEXT,
+                assigned_count INTEGER,
+                submitted_count INTEGER,
+                completion_rate REAL,
+                avg_score REAL
+            )
+        ''')
+
+    def _populate_tables_from_json(self, cursor: sqlite3.Cursor, json_path: str,
+                                   collect_affected: bool = False) -> Optional[set]:
+        """
+        Reads the JSON file and upserts data using a unified mapping.
+
+        Records whose key already exists are updated in place rather than
+        replaced, so re-sending a student or assignment does not cascade-delete
+        its submissions.
+
+        Returns:
+            set or None: With collect_affected, the (grade, class) pairs whose
+            summary rows are affected by the new data; otherwise None.
+        """
         with open(json_path, 'r') as f:
             data = json.load(f)
 
+        # Must run before inserting so that classes records are moving out of are captured too.
+        affected_classes = self._collect_affected_classes(cursor, data) if collect_affected else None
+
         # A unified mapping from JSON keys to table names and column orders.
         # This makes the population logic clean and easy to extend.
         mappings = {
@@ -343,6 +424,8 @@ class DatabaseManager:
             "quizzes": ("quizzes", ["id", "title", "scheduled_date", "grade", "class"]),
             "submissions": ("submissions", ["student_id", "assignment_id", "submitted", "submission_date", "score"]),
         }
+        # Primary key columns used as the upsert conflict target ("id" for all other tables).
+        key_columns = {"submissions": ["student_id", "assignment_id"]}
 
         for json_key, (table_name, json_columns) in mappings.items():
             if json_key in data and data[json_key]:
@@ -352,13 +435,112 @@ class DatabaseManager:
                 # Map JSON columns to database columns (handling 'grades' -> 'grade')
                 db_columns = [col.replace('grades', 'grade').replace('classes', 'class') for col in json_columns]
                 
+                keys = key_columns.get(table_name, ["id"])
+                updates = ", ".join(f"{col} = excluded.{col}" for col in db_columns if col not in keys)
                 placeholders = ", ".join(["?"] * len(db_columns))
-                sql = f"INSERT OR REPLACE INTO {table_name} ({', '.join(db_columns)}) VALUES ({placeholders})"
+                sql = (f"INSERT INTO {table_name} ({', '.join(db_columns)}) VALUES ({placeholders}) "
+                       f"ON CONFLICT({', '.join(keys)}) DO UPDATE SET {updates}")
                 
                 # Create a list of tuples with data in the correct order
                 tuple_data = [[record.get(col) for col in json_columns] for record in records]
                 cursor.executemany(sql, tuple_data)
 
+        return affected_classes
+
+    def _collect_affected_classes(self, cursor: sqlite3.Cursor, data: dict) -> set:
+        """
+        Every summary row depends only on the data of one (grade, class), so a
+        delta load only needs to recompute the classes its records belong to,
+        both before and after the update.
+        """
+        classes = {(record.get("grade"), record.get("class"))
+                   for table in ("students", "assignments") for record in data.get(table) or []}
+
+        # Look up the current classes of every referenced student and assignment in one query.
+        submissions = data.get("submissions") or []
+        referenced_ids = {
+            "students": [r.get("id") for r in data.get("students") or []] + [s.get("student_id") for s in submissions],
+            "assignments": [r.get("id") for r in data.get("assignments") or []] + [s.get("assignment_id") for s in submissions],
+        }
+        for table, ids in referenced_ids.items():
+            cursor.execute(f"CREATE TEMP TABLE IF NOT EXISTS delta_{table} (id TEXT PRIMARY KEY)")
+            cursor.execute(f"DELETE FROM delta_{table}")
+            cursor.executemany(f"INSERT OR IGNORE INTO delta_{table} (id) VALUES (?)", [(i,) for i in ids])
+
+        cursor.execute('''
+            SELECT grade, class FROM students WHERE id IN (SELECT id FROM delta_students)
+            UNION
+            SELECT grade, class FROM assignments WHERE id IN (SELECT id FROM delta_assignments)
+        ''')
+        classes.update(cursor.fetchall())
+        return classes
+
+    def _refresh_summary_tables(self, cursor: sqlite3.Cursor, classes: Optional[set] = None):
+        """
+        Recomputes the summary tables from the raw tables, either completely
+        (classes=None) or only for the given (grade, class) pairs.
+        """
+        def scope_filter(alias: str) -> str:
+            if classes is None:
+                return ""
+            return f"WHERE ({alias}grade, {alias}class) IN (SELECT grade, class FROM summary_scope)"
+
+        if classes is not None:
+            cursor.execute("CREATE TEMP TABLE IF NOT EXISTS summary_scope (grade INTEGER, class TEXT)")
+            cursor.execute("DELETE FROM summary_scope")
+            cursor.executemany("INSERT INTO summary_scope (grade, class) VALUES (?, ?)", list(classes))
+
+        for table in self.SUMMARY_TABLES:
+            cursor.execute(f"DELETE FROM {table} {scope_filter('')}")
+
+        cursor.execute(f'''
+            INSERT INTO assignment_class_stats (assignment_id, title, grade, class, region, student_count,
+                                                submitted_count, submission_rate, avg_score, min_score, max_score)
+            SELECT a.id, a.title, a.grade, a.class, s.region,
+                   COUNT(*),
+                   SUM(CASE WHEN sub.submitted = 1 THEN 1 ELSE 0 END),
+                   ROUND(1.0 * SUM(CASE WHEN sub.submitted = 1 THEN 1 ELSE 0 END) / COUNT(*), 3),
+                   AVG(sub.score), MIN(sub.score), MAX(sub.score)
+            FROM assignments a
+            JOIN students s ON s.grade = a.grade AND s.class = a.class
+            LEFT JOIN submissions sub ON sub.assignment_id = a.id AND sub.student_id = s.id
+            {scope_filter('a.')}
+            GROUP BY a.id, s.region
+        ''')
+
+        cursor.execute(f'''
+            INSERT INTO student_completion_stats (student_id, name, grade, class, region, assigned_count,
+                                                  submitted_count, completion_rate, avg_score)
+            SELECT s.id, s.name, s.grade, s.class, s.region,
+                   COUNT(a.id),
+                   SUM(CASE WHEN sub.submitted = 1 THEN 1 ELSE 0 END),
+                   CASE WHEN COUNT(a.id) > 0
+                        THEN ROUND(1.0 * SUM(CASE WHEN sub.submitted = 1 THEN 1 ELSE 0 END) / COUNT(a.id), 3)
+                   END,
+                   AVG(sub.score)
+            FROM students s
+            LEFT JOIN assignments a ON a.grade = s.grade AND a.class = s.class
+            LEFT JOIN submissions sub ON sub.assignment_id = a.id AND sub.student_id = s.id
+            {scope_filter('s.')}
+            GROUP BY s.id
+        ''')
+
+    def _has_summary_tables(self, cursor: sqlite3.Cursor) -> bool:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
+        tables = {row[0] for row in cursor.fetchall()}
+        return all(table in tables for table in self.SUMMARY_TABLES)
+
+    def ensure_summary_tables(self):
+        """Creates and fills the summary tables in a database ingested before they existed."""
+        with closing(sqlite3.connect(self.db_path)) as conn:
+            cursor = conn.cursor()
+            if self._has_summary_tables(cursor):
+                return
+            print("Building missing summary tables...")
+            self._create_tables(cursor)
+            self._refresh_summary_tables(cursor)
+            conn.commit()
+
 
     def get_schema_representation(self, custom_rules: Optional[List[str]] = None) -> str:
         """
@@ -390,8 +572,63 @@ class DatabaseManager:
             output.append("\nKey relationships:")
             output.extend(sorted(all_foreign_keys))
 
+        summary_tables = [table for table in self.SUMMARY_TABLES if table in tables]
+        if summary_tables:
+            output.append("\nPre-aggregated summary tables (prefer these over aggregating submissions, students "
+                          "or assignments for counts, rates and score statistics; filter them by admin access "
+                          "by joining admins on grade, class and region):")
+            output.extend(f"- {table}: {self.SUMMARY_TABLES[table]}" for table in summary_tables)
+
         if custom_rules:
             output.append("")
             output.extend(custom_rules)
 
-        return "\n".join(output)
\ No newline at end of file
+        return "\n".join(output)
+
+    def is_valid_database(self) -> bool:
+        """
+        Checks whether the database file exists, is readable by SQLite and
+        contains every table in REQUIRED_TABLES. Only the schema is read, so
+        this stays cheap for large databases.
+        """
+        if not os.path.exists(self.db_path):
+            return False
+
+        try:
+            # Open read-only so a missing/corrupt file is never created or modified.
+            with closing(sqlite3.connect(pathlib.Path(self.db_path).resolve().as_uri() + "?mode=ro", uri=True)) as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
+                tables = {row[0] for row in cursor.fetchall()}
+        except sqlite3.Error as e:
+            print(f"Existing database at '{self.db_path}' is not usable: {e}")
+            return False
+
+        return all(table in tables for table in self.REQUIRED_TABLES)
+
+    def get_cached_schema_representation(self, custom_rules: Optional[List[str]] = None) -> str:
+        """
+        Returns the schema representation from the cache file next to the
+        database, regenerating (and re-caching) it when the database has been
+        modified since or the custom rules differ.
+        """
+        db_mtime = os.path.getmtime(self.db_path) if os.path.exists(self.db_path) else None
+        rules = list(custom_rules or [])
+
+        if db_mtime is not None and os.path.exists(self.schema_cache_path):
+            try:
+                with open(self.schema_cache_path, 'r') as f:
+                    cached = json.load(f)
+                if cached.get("db_mtime") == db_mtime and cached.get("custom_rules") == rules:
+                    return cached["schema"]
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Ignoring unreadable schema cache '{self.schema_cache_path}': {e}")
+
+        schema = self.get_schema_representation(custom_rules=custom_rules)
+        if db_mtime is not None:
+            try:
+                with open(self.schema_cache_path, 'w') as f:
+                    json.dump({"db_mtime": db_mtime, "custom_rules": rules, "schema": schema}, f)
+            except OSError as e:
+                print(f"Could not write schema cache '{self.schema_cache_path}': {e}")
+        return schema
@@ -1,12 +1,18 @@
 
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import PromptTemplate
-from langchain_core.pydantic_v1 import BaseModel, Field
+# langchain_openai, langchain_core and pandas are imported lazily inside the
+# methods that need them so that importing this module (and booting the app)
+# stays cheap. Call `QueryAgent.warm_up()` to pay that cost ahead of time.
+from pydantic import BaseModel, Field
+import concurrent.futures
 import traceback
+import threading
+import asyncio
+import copy
+import random
 import sqlite3
 import json
+import time
 import os
-import pandas as pd
 
 template="""
         You are an expert SQLite analyst. Convert the natural language query to a valid SQLite statement.
@@ -15,7 +21,7 @@ template="""
 
         ---
         CRITICAL RULES:
-        1.  **MANDATORY ADMIN FILTER**: You MUST filter the students or related data based on the admin's access rights. The main `FROM` clause **must** join `students` with the `admins` table on their shared `grade`, `class`, and `region`. The query must then be filtered with `WHERE admins.id = '{admin_id}'`. This is the most important rule.
+        1.  **MANDATORY ADMIN FILTER**: You MUST filter the students or related data based on the admin's access rights. The main `FROM` clause **must** join `students` (or a pre-aggregated summary table, which also has `grade`, `class` and `region`) with the `admins` table on their shared `grade`, `class`, and `region`. The query must then be filtered with `WHERE admins.id = '{admin_id}'`. This is the most important rule.
 
         2.  **FINDING NON-EXISTENT DATA (Exclusion)**: To find items that do NOT have an entry in another table (e.g., students who have not submitted), the most reliable method is a `WHERE ... NOT IN (SELECT ...)` subquery.
         
@@ -39,20 +45,183 @@ template="""
         Return only a single, valid SELECT statement.
         """
 
+answer_template="""
+                You are an AI assistant. Use the structured data it's from database it has the answer to user's query. Just convert the data into proper answer.
+                
+                User Question: "{question}"
+                
+                Data (from SQL):
+                {data}
+                
+                Respond clearly and concisely based on the data. Avoid speculation. If data is missing or empty, say so.
+                """
+
 class ResponseSchemaSQL(BaseModel):
     """Schema for sql response"""
     sql_query: str = Field(description="The generated SQL query.")
    
+def is_rate_limit_error(error):
+    """True for HTTP 429 errors from the LLM provider (e.g. openai.RateLimitError)."""
+    return getattr(error, "status_code", None) == 429 or type(error).__name__ == "RateLimitError"
+
+
+def question_key(admin_id, question):
+    """
+    Key under which identical questions are shared. Only whitespace is
+    normalized: case can change the generated SQL (e.g. class '8A' vs '8a').
+    """
+    return str(admin_id).strip(), " ".join(question.split())
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key: the first caller (the leader)
+    runs the function and every caller that arrives while it is running waits
+    for and receives the leader's result (or exception).
+
+    Threads wait on the shared future directly; asyncio tasks await it
+    without holding a worker thread.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    def _join(self, key):
+        """Returns the in-flight future for `key` and whether the caller must run it."""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = self._calls[key] = concurrent.futures.Future()
+            self.executed += 1
+            return future, True
+
+    def _run(self, key, future, fn):
+        try:
+            result = fn()
+        except BaseException as e:
+            # Forget the key before waking waiters so later callers start a fresh call.
+            with self._lock:
+                del self._calls[key]
+            future.set_exception(e)
+        else:
+            with self._lock:
+                del self._calls[key]
+            future.set_result(result)
+
+    def do(self, key, fn):
+        future, leader = self._join(key)
+        if leader:
+            self._run(key, future, fn)
+        return future.result()
+
+    async def do_async(self, key, fn):
+        future, leader = self._join(key)
+        if leader:
+            asyncio.get_running_loop().run_in_executor(None, self._run, key, future, fn)
+        return await asyncio.wrap_future(future)
+
+    def metrics(self):
+        with self._lock:
+            return {"executed": self.executed, "coalesced": self.coalesced, "in_flight": len(self._calls)}
+
+
 class QueryAgent:
-    def __init__(self, db_path="school_management.db", schema_for_llm=None):
+    def __init__(self, db_path="school_management.db", schema_for_llm=None, llm=None,
+                 rate_limiter=None, max_retries=5, retry_base_delay=1.0):
+        """
+        Args:
+            llm: Optional chat model to use instead of the default ChatOpenAI
+                (e.g. a local stub for offline runs).
+            rate_limiter: Optional object with an `acquire(tokens)` method that
+                blocks until an LLM request of roughly that size may be sent.
+            max_retries (int): How many times a rate-limited (429) LLM call is
+                retried. Only used with a rate_limiter; without one the
+                client's own retries apply.
+            retry_base_delay (float): Initial backoff in seconds, doubled on each retry.
+        """
         self.db_path = db_path
         self.schema_for_llm = schema_for_llm
-        self.llm = ChatOpenAI(model="gpt-4o", temperature=0.3)
-        
-    
-    def query_to_sql_chain(self, natural_query: str, admin_id: int, schema: str):
-        """Convert a natural language query into a SQL statement using LangChain + OpenAI"""
-        
+        self._llm = llm
+        self._sql_chain = None
+        self._answer_chain = None
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self.retry_base_delay = retry_base_delay
+        # Concurrent identical requests share one execution of each stage.
+        self._flights = {
+            "answer_question": SingleFlight(),
+            "query_to_sql_chain": SingleFlight(),
+            "execute_query": SingleFlight(),
+        }
+
+    def get_coalescing_metrics(self):
+        """
+        Per-stage counts of calls executed and joined to an identical in-flight
+        call, plus under "saved" the LLM calls and SQL executions those joins
+        avoided. A joined answer_question skips a whole pipeline (two LLM
+        calls and one SQL execution).
+        """
+        metrics = {name: flight.metrics() for name, flight in self._flights.items()}
+        metrics["saved"] = {
+            "llm_calls": 2 * metrics["answer_question"]["coalesced"] + metrics["query_to_sql_chain"]["coalesced"],
+            "sql_executions": metrics["answer_question"]["coalesced"] + metrics["execute_query"]["coalesced"],
+        }
+        return metrics
+
+    @classmethod
+    def restore(cls, db_path, custom_rules=None, **kwargs):
+        """
+        Builds a QueryAgent from an existing, valid database file so questions
+        can be answered right after a restart without re-ingesting the JSON.
+
+        Returns:
+            QueryAgent or None: None when there is no usable database or it
+            could not be opened, so callers can fall back to the upload flow.
+        """
+        from data_manager import DatabaseManager
+
+        try:
+            db_manager = DatabaseManager(db_path=db_path)
+            if not db_manager.is_valid_database():
+                return None
+            db_manager.ensure_summary_tables()
+            schema_for_llm = db_manager.get_cached_schema_representation(custom_rules=custom_rules)
+        except Exception as e:
+            print(f"Could not restore the existing database at '{db_path}': {e}")
+            return None
+        return cls(db_path=db_path, schema_for_llm=schema_for_llm, **kwargs)
+
+    @property
+    def llm(self):
+        """The chat model, created on first use so construction stays cheap."""
+        if self._llm is None:
+            from langchain_openai import ChatOpenAI
+            if self.rate_limiter is not None:
+                # Let _invoke_llm be the only retry loop so every request passes the limiter.
+                self._llm = ChatOpenAI(model="gpt-4o", temperature=0.3, max_retries=0)
+            else:
+                self._llm = ChatOpenAI(model="gpt-4o", temperature=0.3)
+        return self._llm
+
+    def warm_up(self):
+        """Import the heavy dependencies and build the LLM chains ahead of the first question."""
+        import pandas  # noqa: F401
+        self._get_sql_chain()
+        self._get_answer_chain()
+        return self
+
+    def _get_sql_chain(self):
+        """Build (once) the prompt | structured LLM chain used for NL-to-SQL."""
+        if self._sql_chain is not None:
+            return self._sql_chain
+
+        from langchain_core.prompts import PromptTemplate
+
         prompt = PromptTemplate(
             input_variables=["query", "admin_id", "schema"],
             template=template
@@ -82,19 +251,71 @@ class QueryAgent:
         structured_llm = self.llm.with_structured_output(ResponseSchemaSQL)
         
         # Create the chain using LangChain Expression Language (LCEL)
-        chain = prompt | structured_llm
+        self._sql_chain = prompt | structured_llm
+        return self._sql_chain
+
+    def _get_answer_chain(self):
+        """Build (once) the prompt | LLM chain that turns rows into a final answer."""
+        if self._answer_chain is None:
+            from langchain_core.prompts import PromptTemplate
+
+            prompt = PromptTemplate(
+                input_variables=["question", "data"],
+                template=answer_template
+            )
+            self._answer_chain = prompt | self.llm
+        return self._answer_chain
+
+    def _invoke_llm(self, chain, inputs, template_text):
+        """
+        Invoke an LLM chain. With a rate limiter, wait on it first and retry
+        429 responses with exponential backoff and jitter.
+        """
+        # Rough token estimate (~4 characters per token) plus room for the reply.
+        estimated_tokens = (len(template_text) + sum(len(str(v)) for v in inputs.values())) // 4 + 256
+
+        # Interactive use has no limiter and relies on the client's own retries.
+        max_retries = self.max_retries if self.rate_limiter is not None else 0
+
+        for attempt in range(max_retries + 1):
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(estimated_tokens)
+            try:
+                return chain.invoke(inputs)
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt == max_retries:
+                    raise
+                delay = min(self.retry_base_delay * (2 ** attempt), 60.0) * (1 + random.random())
+                print(f"LLM rate limited, retrying in {delay:.1f}s ({attempt + 1}/{max_retries})")
+                time.sleep(delay)
+
+    def query_to_sql_chain(self, natural_query: str, admin_id: int, schema: str):
+        """Convert a natural language query into a SQL statement using LangChain + OpenAI"""
+        key = (question_key(admin_id, natural_query), schema)
+        return self._flights["query_to_sql_chain"].do(
+            key, lambda: self._query_to_sql_chain(natural_query, admin_id, schema))
+
+    def _query_to_sql_chain(self, natural_query, admin_id, schema):
+        chain = self._get_sql_chain()
 
         # Invoke the chain with the input dictionary
-        result = chain.invoke({
+        result = self._invoke_llm(chain, {
             "query": natural_query,
             "admin_id": admin_id,
             "schema": schema
-        })
+        }, template)
 
         return result.sql_query.strip()
     
     def execute_query(self, sql_query):
         """Execute SQL query safely"""
+        result = self._flights["execute_query"].do(sql_query.strip(), lambda: self._execute_query(sql_query))
+        # Coalesced callers share the leader's result; give each caller its own copy.
+        return copy.deepcopy(result)
+
+    def _execute_query(self, sql_query):
+        import pandas as pd
+
         try:
             # Basic SQL injection prevention
             if not sql_query.strip().upper().startswith('SELECT'):
@@ -118,6 +339,22 @@ class QueryAgent:
     
     def answer_question(self, question, admin_id):
         """Answer a user query by generating SQL, retrieving data, and using LLM for final answer generation"""
+        result = self._flights["answer_question"].do(
+            question_key(admin_id, question), lambda: self._answer_question(question, admin_id))
+        # Coalesced callers share the leader's result; give each caller its own copy.
+        return copy.deepcopy(result)
+
+    async def aanswer_question(self, question, admin_id):
+        """
+        Async variant of `answer_question`. The leader runs in a worker thread;
+        tasks joining an in-flight call (from other tasks or threads) await it
+        without using a thread.
+        """
+        result = await self._flights["answer_question"].do_async(
+            question_key(admin_id, question), lambda: self._answer_question(question, admin_id))
+        return copy.deepcopy(result)
+
+    def _answer_question(self, question, admin_id):
         try:
             # Step 1: Convert NL to SQL
             sql_query = self.query_to_sql_chain(natural_query=question, 
@@ -137,26 +374,12 @@ class QueryAgent:
             data = result["data"]
             print(f'output data: {data}')
             # Step 3: Generate final answer via LLM
-            prompt = PromptTemplate(
-                input_variables=["question", "data"],
-                template="""
-                You are an AI assistant. Use the structured data it's from database it has the answer to user's query. Just convert the data into proper answer.
-                
-                User Question: "{question}"
-                
-                Data (from SQL):
-                {data}
-                
-                Respond clearly and concisely based on the data. Avoid speculation. If data is missing or empty, say so.
-                """
-            )
-
-            chain = prompt | self.llm
+            chain = self._get_answer_chain()
 
-            response = chain.invoke({
+            response = self._invoke_llm(chain, {
                 "question": question,
                 "data": str(data)
-            })
+            }, answer_template)
             
 
             return {
@@ -0,0 +1,25 @@
+import os
+
+import pytest
+
+from data_manager import DatabaseManager
+from query_system import QueryAgent
+
+DATASET_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "dataset.json")
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """A database populated from the bundled dataset.json."""
+    path = str(tmp_path / "school.db")
+    DatabaseManager(db_path=path).setup_database_from_json(json_path=DATASET_PATH)
+    return path
+
+
+@pytest.fixture
+def make_agent(db_path):
+    """Builds a QueryAgent on the `db_path` database; extra kwargs go to QueryAgent."""
+    def make(llm, **kwargs):
+        schema = DatabaseManager(db_path=db_path).get_schema_representation()
+        return QueryAgent(db_path=db_path, schema_for_llm=schema, llm=llm, **kwargs)
+    return make
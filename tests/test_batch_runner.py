@@ -0,0 +1,134 @@
+import io
+import json
+
+import pytest
+
+from batch_runner import LLMRateLimiter, StubLLM, TokenBucket, run_batch
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def fast_limiter():
+    return LLMRateLimiter(requests_per_minute=10**6, tokens_per_minute=10**9)
+
+
+def test_token_bucket_throttles_once_capacity_is_spent(clock):
+    bucket = TokenBucket(rate_per_minute=60, capacity=2, clock=clock.monotonic, sleep=clock.sleep)
+
+    bucket.acquire()
+    bucket.acquire()
+    assert clock.sleeps == []
+
+    # Refills at 1 token per second.
+    bucket.acquire()
+    assert clock.now == pytest.approx(1.0)
+
+    bucket.acquire(2)
+    assert clock.now == pytest.approx(3.0)
+
+
+def test_token_bucket_caps_requests_larger_than_capacity(clock):
+    bucket = TokenBucket(rate_per_minute=60, capacity=5, clock=clock.monotonic, sleep=clock.sleep)
+
+    bucket.acquire(50)
+    assert clock.sleeps == []
+
+
+def test_rate_limiter_limits_requests_and_tokens(clock):
+    limiter = LLMRateLimiter(requests_per_minute=120, tokens_per_minute=600, clock=clock.monotonic, sleep=clock.sleep)
+
+    for _ in range(120):
+        limiter.acquire(1)
+    assert clock.now == 0.0
+
+    limiter.acquire(1)
+    assert clock.now == pytest.approx(0.5)
+
+    # One more request slot after 0.5s; then 600 tokens with 489 left at 10 per second.
+    limiter.acquire(600)
+    assert clock.now == pytest.approx(1.0 + 11.1)
+
+
+def test_rate_limited_calls_are_retried(make_agent):
+    llm = StubLLM(rate_limit_every=2)
+    agent = make_agent(llm, rate_limiter=fast_limiter(), retry_base_delay=0.001)
+
+    response = agent.answer_question("Which students are mine?", "ADM001")
+
+    assert "error" not in response
+    assert response["answer"] == "Stub answer based on 2 row(s)."
+    # SQL call, 429 on the answer call, then the retried answer call.
+    assert llm.calls == 3
+
+
+def test_rate_limit_error_is_returned_after_max_retries(make_agent):
+    llm = StubLLM(rate_limit_every=1)
+    agent = make_agent(llm, rate_limiter=fast_limiter(), max_retries=2, retry_base_delay=0.001)
+
+    response = agent.answer_question("Which students are mine?", "ADM001")
+
+    assert "Rate limit" in response["error"]
+    assert llm.calls == 3
+
+
+def test_no_retries_without_rate_limiter(make_agent):
+    llm = StubLLM(rate_limit_every=2)
+    agent = make_agent(llm, retry_base_delay=0.001)
+
+    response = agent.answer_question("Which students are mine?", "ADM001")
+
+    assert "Rate limit" in response["error"]
+    assert llm.calls == 2
+
+
+def test_run_batch_dedupes_and_writes_ndjson(make_agent):
+    llm = StubLLM()
+    agent = make_agent(llm)
+    questions = [
+        ("ADM001", "Which students are mine?"),
+        ("ADM002", "Which students are mine?"),
+        ("ADM001", "  Which students are   mine? "),
+        ("ADM001", "WHICH STUDENTS ARE MINE?"),
+    ]
+    output = io.StringIO()
+
+    summary = run_batch(agent, questions, output, max_workers=2)
+
+    records = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert sorted(r["index"] for r in records) == [0, 1, 2, 3]
+    by_index = {r["index"]: r for r in records}
+    assert by_index[2]["deduplicated"] is True
+    assert by_index[2]["answer"] == by_index[0]["answer"]
+    # Case can change the generated SQL, so it is not deduplicated.
+    assert by_index[3]["deduplicated"] is False
+    assert [row["name"] for row in by_index[1]["data"]] == ["David Kim"]
+    assert summary["questions"] == 4
+    assert summary["unique_questions"] == 3
+    assert summary["errors"] == 0
+    # Two LLM calls for each unique question.
+    assert llm.calls == 6
+
+
+def test_default_client_does_not_retry_on_its_own_when_rate_limited(make_agent, monkeypatch):
+    pytest.importorskip("langchain_openai")
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+
+    agent = make_agent(None, rate_limiter=LLMRateLimiter())
+
+    assert agent.llm.max_retries == 0
@@ -0,0 +1,237 @@
+import json
+import os
+import sqlite3
+from contextlib import closing
+
+import pytest
+
+from conftest import DATASET_PATH
+from data_manager import DatabaseManager
+from query_system import QueryAgent
+
+
+def summary_rows(db_path):
+    with closing(sqlite3.connect(db_path)) as conn:
+        return {
+            table: conn.execute(f"SELECT * FROM {table} ORDER BY 1, 2, 3, 4, 5").fetchall()
+            for table in DatabaseManager.SUMMARY_TABLES
+        }
+
+
+def submission_rows(db_path):
+    with closing(sqlite3.connect(db_path)) as conn:
+        return set(conn.execute("SELECT * FROM submissions").fetchall())
+
+
+def full_rebuild_rows(db_path):
+    """The summary rows a complete rebuild produces from the current raw tables."""
+    with closing(sqlite3.connect(db_path)) as conn:
+        DatabaseManager(db_path=db_path)._refresh_summary_tables(conn.cursor())
+        conn.commit()
+    return summary_rows(db_path)
+
+
+def load_delta(tmp_path, db_path, delta):
+    json_path = tmp_path / "delta.json"
+    json_path.write_text(json.dumps(delta))
+    DatabaseManager(db_path=db_path).setup_database_from_json(json_path=str(json_path), overwrite=False)
+
+
+def test_full_ingest_builds_summary_tables(db_path):
+    rows = summary_rows(db_path)
+
+    assert ("A001", "Math Homework Chapter 5", 8, "8A", "North", 2, 2, 1.0, 88.5, 85, 92) in rows["assignment_class_stats"]
+    assert ("S004", "David Kim", 9, "9A", "South", 2, 1, 0.5, 88.0) in rows["student_completion_stats"]
+
+
+@pytest.mark.parametrize("delta", [
+    pytest.param({
+        "students": [{"id": "S002", "name": "Bob Martinez", "grade": 9, "class": "9A", "region": "South"}],
+    }, id="student-moves-class"),
+    pytest.param({
+        "submissions": [{"student_id": "S003", "assignment_id": "A002", "submitted": True,
+                         "submission_date": "2024-07-20", "score": 64}],
+    }, id="new-submission"),
+    pytest.param({
+        "assignments": [{"id": "A009", "title": "New", "due_date": "2024-09-01", "grade": 8, "class": "8A"}],
+        "submissions": [{"student_id": "S001", "assignment_id": "A009", "submitted": True,
+                         "submission_date": "2024-08-30", "score": 70}],
+    }, id="new-assignment"),
+])
+def test_delta_load_matches_full_rebuild(tmp_path, db_path, delta):
+    before = summary_rows(db_path)
+    submissions_before = submission_rows(db_path)
+
+    load_delta(tmp_path, db_path, delta)
+    incremental = summary_rows(db_path)
+
+    assert incremental != before
+    assert incremental == full_rebuild_rows(db_path)
+    # Upserting students/assignments must not cascade-delete their submissions.
+    assert submissions_before <= submission_rows(db_path)
+
+
+def test_delta_load_updates_records_in_place(tmp_path, db_path):
+    load_delta(tmp_path, db_path, {
+        "students": [{"id": "S002", "name": "Robert Martinez", "grade": 8, "class": "8A", "region": "North"}],
+        "assignments": [{"id": "A001", "title": "Math Homework Chapter 6", "due_date": "2024-07-12",
+                         "grade": 8, "class": "8A"}],
+    })
+
+    with closing(sqlite3.connect(db_path)) as conn:
+        assert conn.execute("SELECT name FROM students WHERE id = 'S002'").fetchone() == ("Robert Martinez",)
+        assert conn.execute("SELECT title FROM assignments WHERE id = 'A001'").fetchone() == ("Math Homework Chapter 6",)
+        assert conn.execute("SELECT score FROM submissions WHERE student_id = 'S002' AND assignment_id = 'A001'").fetchone() == (92,)
+
+
+def test_full_ingest_skips_affected_class_lookup(tmp_path, monkeypatch):
+    def fail(self, cursor, data):
+        raise AssertionError("only needed for delta loads")
+
+    monkeypatch.setattr(DatabaseManager, "_collect_affected_classes", fail)
+    manager = DatabaseManager(db_path=str(tmp_path / "fresh.db"))
+    manager.setup_database_from_json(json_path=DATASET_PATH)
+
+    assert manager.is_valid_database()
+    assert summary_rows(manager.db_path)["assignment_class_stats"]
+
+
+def test_delta_load_into_database_without_summary_tables_rebuilds_them(tmp_path, db_path):
+    # A database ingested before the summary tables existed.
+    with closing(sqlite3.connect(db_path)) as conn:
+        for table in DatabaseManager.SUMMARY_TABLES:
+            conn.execute(f"DROP TABLE {table}")
+        conn.commit()
+
+    load_delta(tmp_path, db_path, {
+        "submissions": [{"student_id": "S003", "assignment_id": "A002", "submitted": True,
+                         "submission_date": "2024-07-20", "score": 64}],
+    })
+    DatabaseManager(db_path=db_path).ensure_summary_tables()
+    rows = summary_rows(db_path)
+
+    assert rows == full_rebuild_rows(db_path)
+    assert any(row[0] == "A001" for row in rows["assignment_class_stats"])
+    assert any(row[0] == "S001" for row in rows["student_completion_stats"])
+
+
+def test_ensure_summary_tables_backfills_legacy_database(db_path):
+    with closing(sqlite3.connect(db_path)) as conn:
+        for table in DatabaseManager.SUMMARY_TABLES:
+            conn.execute(f"DROP TABLE {table}")
+        conn.commit()
+
+    DatabaseManager(db_path=db_path).ensure_summary_tables()
+
+    assert summary_rows(db_path) == full_rebuild_rows(db_path)
+
+
+def test_schema_representation_describes_summary_tables(db_path):
+    schema = DatabaseManager(db_path=db_path).get_schema_representation()
+
+    assert "Pre-aggregated summary tables" in schema
+    assert "- assignment_class_stats:" in schema
+    assert "- student_completion_stats:" in schema
+
+
+def test_is_valid_database_accepts_ingested_database(db_path):
+    assert DatabaseManager(db_path=db_path).is_valid_database()
+
+
+def test_is_valid_database_handles_uri_characters_in_path(tmp_path):
+    path = tmp_path / "we?ird#50%" / "x.db"
+    path.parent.mkdir()
+    manager = DatabaseManager(db_path=str(path))
+    manager.setup_database_from_json(json_path=DATASET_PATH)
+
+    assert manager.is_valid_database()
+
+
+def test_is_valid_database_rejects_missing_file(tmp_path):
+    path = tmp_path / "missing.db"
+
+    assert not DatabaseManager(db_path=str(path)).is_valid_database()
+    # The check must not create the file.
+    assert not path.exists()
+
+
+def test_is_valid_database_rejects_corrupt_file(tmp_path):
+    path = tmp_path / "corrupt.db"
+    path.write_bytes(b"not a database" * 100)
+
+    assert not DatabaseManager(db_path=str(path)).is_valid_database()
+
+
+def test_is_valid_database_rejects_partial_schema(db_path):
+    with closing(sqlite3.connect(db_path)) as conn:
+        conn.execute("DROP TABLE submissions")
+        conn.commit()
+
+    assert not DatabaseManager(db_path=db_path).is_valid_database()
+
+
+def test_cached_schema_is_reused_while_database_is_unchanged(db_path):
+    manager = DatabaseManager(db_path=db_path)
+    schema = manager.get_cached_schema_representation(custom_rules=["rule"])
+    assert schema == manager.get_schema_representation(custom_rules=["rule"])
+
+    # Tamper with the cached text: a cache hit returns it without regenerating.
+    with open(manager.schema_cache_path) as f:
+        cached = json.load(f)
+    cached["schema"] = "cached schema"
+    with open(manager.schema_cache_path, "w") as f:
+        json.dump(cached, f)
+
+    assert manager.get_cached_schema_representation(custom_rules=["rule"]) == "cached schema"
+
+
+def test_cached_schema_is_invalidated_when_database_changes(db_path):
+    manager = DatabaseManager(db_path=db_path)
+    manager.get_cached_schema_representation()
+    with closing(sqlite3.connect(db_path)) as conn:
+        conn.execute("CREATE TABLE extra (id TEXT)")
+        conn.commit()
+    mtime = os.path.getmtime(db_path) + 10
+    os.utime(db_path, (mtime, mtime))
+
+    assert "extra: id" in manager.get_cached_schema_representation()
+
+
+def test_cached_schema_is_invalidated_when_rules_change(db_path):
+    manager = DatabaseManager(db_path=db_path)
+    manager.get_cached_schema_representation(custom_rules=["old rule"])
+
+    schema = manager.get_cached_schema_representation(custom_rules=["new rule"])
+
+    assert "new rule" in schema
+    assert "old rule" not in schema
+
+
+def test_corrupt_schema_cache_is_regenerated(db_path):
+    manager = DatabaseManager(db_path=db_path)
+    with open(manager.schema_cache_path, "w") as f:
+        f.write("{not json")
+
+    assert manager.get_cached_schema_representation() == manager.get_schema_representation()
+    with open(manager.schema_cache_path) as f:
+        assert json.load(f)["schema"] == manager.get_schema_representation()
+
+
+def test_restore_builds_agent_from_existing_database(db_path):
+    agent = QueryAgent.restore(db_path, custom_rules=["rule"])
+
+    assert agent.db_path == db_path
+    assert agent.schema_for_llm == DatabaseManager(db_path=db_path).get_schema_representation(custom_rules=["rule"])
+
+
+def test_restore_returns_none_without_a_database(tmp_path):
+    assert QueryAgent.restore(str(tmp_path / "missing.db")) is None
+
+
+def test_restore_falls_back_on_sqlite_errors(db_path, monkeypatch):
+    def locked(self):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(DatabaseManager, "ensure_summary_tables", locked)
+
+    assert QueryAgent.restore(db_path) is None
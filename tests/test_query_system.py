@@ -0,0 +1,159 @@
+import asyncio
+import threading
+import time
+
+from batch_runner import StubLLM
+from query_system import SingleFlight, question_key
+
+
+class GatedStubLLM(StubLLM):
+    """Holds every LLM call until `release` is set, so concurrent callers are sure to overlap."""
+
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+
+    def _call(self):
+        self.release.wait(5)
+        super()._call()
+
+
+def wait_until(condition):
+    deadline = time.monotonic() + 5
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.001)
+
+
+def ask_from_threads(agent, llm, n, question="Who submitted?", admin_id="ADM001"):
+    """Asks the same question from `n` threads, releasing the LLM once all of them have joined."""
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(agent.answer_question(question, admin_id)))
+               for _ in range(n)]
+    for thread in threads:
+        thread.start()
+    wait_until(lambda: agent.get_coalescing_metrics()["answer_question"]["coalesced"] == n - 1)
+    llm.release.set()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_question_key_ignores_case_and_whitespace():
+    assert question_key(" ADM001", "Who  submitted?") == question_key("ADM001", "Who submitted? ")
+    assert question_key("ADM001", "Who submitted?") != question_key("ADM002", "Who submitted?")
+
+
+def test_question_key_keeps_case():
+    # SQLite string comparison is case-sensitive, so these can have different answers.
+    assert question_key("ADM001", "Students in class '8a'") != question_key("ADM001", "Students in class '8A'")
+
+
+def test_single_flight_shares_result_between_threads():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+    results = []
+
+    def work():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {"rows": [1, 2]}
+
+    leader = threading.Thread(target=lambda: results.append(flight.do("key", work)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(flight.do("key", work))) for _ in range(4)]
+    for thread in followers:
+        thread.start()
+    while flight.metrics()["coalesced"] < 4:
+        time.sleep(0.001)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == [{"rows": [1, 2]}] * 5
+    assert flight.metrics() == {"executed": 1, "coalesced": 4, "in_flight": 0}
+
+
+def test_single_flight_shares_exception_between_threads():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    errors = []
+
+    def work():
+        started.set()
+        release.wait(5)
+        raise ValueError("boom")
+
+    def call():
+        try:
+            flight.do("key", work)
+        except ValueError as e:
+            errors.append(e)
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=call) for _ in range(3)]
+    for thread in followers:
+        thread.start()
+    while flight.metrics()["coalesced"] < 3:
+        time.sleep(0.001)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join()
+
+    assert len(errors) == 4
+    assert all(e is errors[0] for e in errors)
+    # Finished calls are forgotten, so the next caller runs again.
+    assert flight.do("key", lambda: "fresh") == "fresh"
+
+
+def test_concurrent_threads_share_one_pipeline(make_agent):
+    llm = GatedStubLLM()
+    agent = make_agent(llm)
+
+    results = ask_from_threads(agent, llm, 10)
+
+    assert llm.calls == 2
+    assert all(r == results[0] for r in results)
+    metrics = agent.get_coalescing_metrics()
+    assert metrics["answer_question"] == {"executed": 1, "coalesced": 9, "in_flight": 0}
+    assert metrics["saved"] == {"llm_calls": 18, "sql_executions": 9}
+
+
+def test_concurrent_tasks_share_one_pipeline_without_threads(make_agent):
+    llm = GatedStubLLM()
+    agent = make_agent(llm)
+
+    async def ask_all():
+        tasks = [asyncio.ensure_future(agent.aanswer_question("Who submitted?", "ADM001")) for _ in range(50)]
+        deadline = time.monotonic() + 5
+        while agent.get_coalescing_metrics()["answer_question"]["coalesced"] < 49:
+            assert time.monotonic() < deadline, "timed out"
+            await asyncio.sleep(0.001)
+        llm.release.set()
+        return await asyncio.gather(*tasks)
+
+    results = asyncio.run(ask_all())
+
+    # One SQL generation and one answer generation for all 50 tasks.
+    assert llm.calls == 2
+    assert agent.get_coalescing_metrics()["saved"] == {"llm_calls": 98, "sql_executions": 49}
+    assert all(r["answer"] == "Stub answer based on 2 row(s)." for r in results)
+
+
+def test_coalesced_results_are_independent_copies(make_agent):
+    llm = GatedStubLLM()
+    agent = make_agent(llm)
+
+    results = ask_from_threads(agent, llm, 2)
+    results[0]["data"][0]["name"] = "changed"
+
+    assert llm.calls == 2
+    assert results[1]["data"][0]["name"] == "Alice Johnson"